@@ -1,9 +1,11 @@
 from __future__ import annotations
 
+import functools
 import shutil
 from enum import Enum
 from pathlib import Path
 import os
+import re
 from typing import Optional, Union
 
 
@@ -14,6 +16,16 @@ Assumptions:
 """
 
 
+_COMMAND_RE = re.compile(r'<{1,2}\d+>{1,2}')  # The last word of a line (if it is a command)
+
+
+def _remove_enclosing_quotation_marks(s: str) -> str:
+    # Only a matching pair, so that e.g. "it's" stays as it is.
+    if len(s) >= 2 and s[0] == s[-1] and s[0] in "'\"":
+        s = s[1:-1]
+    return s
+
+
 def _remove(path: Path, prompt: bool = True) -> None:
     if path.is_dir():
         if len(os.listdir(path)) == 0:
@@ -32,59 +44,90 @@ def _remove(path: Path, prompt: bool = True) -> None:
 def _is_seemingly_dir(path: Union[Path, str]) -> bool:
     # Different from os.path.isdir(path)
     # We do not check if it really exist.
-    return os.path.splitext(path)[1] == ""
+    # Same as os.path.splitext(path)[1] == "" but with plain string operations (since it is called for every filename).
+    path = str(path)
+    filename = path[max(path.rfind("/"), path.rfind("\\")) + 1:]
+    return "." not in filename.lstrip(".")  # Leading dots do not start an extension (e.g. ".bashrc").
 
 
-def _as_path(path_or_file_structure: Union[Path, FileStructure]) -> Path:
-    if isinstance(path_or_file_structure, Path):
-        path = path_or_file_structure
-    elif isinstance(path_or_file_structure, FileStructure):
-        path = path_or_file_structure.path()
-    else:
-        assert False
-    return path
+def _exists(path: Path, exists: Optional[bool] = None) -> bool:
+    # exists may already be known (e.g. from a directory listing). Otherwise, we check it.
+    return path.exists() if exists is None else exists
+
+
+def _list_dir_entries(path: Path) -> dict[str, os.DirEntry]:
+    # name -> entry in the directory (nothing if it does not exist) with a single scandir rather than a stat per file.
+    # NotADirectoryError is raised (as os.listdir() does) if path is an ordinary file.
+    try:
+        with os.scandir(path) as entries:
+            return {entry.name: entry for entry in entries}
+    except FileNotFoundError:
+        return {}
 
 
-def _absent_but_create(path: Path) -> None:
-    assert not path.exists(), f"There must not be '{path}' but there is."
+def _create_new(path: Path) -> None:
+    # Checking and creating at once (i.e. without a separate path.exists()), which is also race-free.
+    # Raises FileExistsError if it exists.
     if _is_seemingly_dir(path):
         os.makedirs(path)
     else:
-        open(path, "w").close()
+        os.close(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
 
 
-def _present_but_remove(path: Path, prompt: bool = True) -> None:
-    assert path.exists(), f"There must be '{path}' but there is not."
+def _absent_but_create(path: Path, exists: Optional[bool] = None) -> None:
+    if not exists:
+        try:
+            _create_new(path)
+            return
+        except FileExistsError:
+            pass
+    raise FileExistsError(f"There must not be '{path}' but there is.")
+
+
+def _create_if_absent(path: Path, exists: Optional[bool] = None) -> None:
+    if exists:
+        return
+    try:
+        _create_new(path)
+    except FileExistsError:
+        pass  # It exists. (e.g. A file where a directory seems to be. We did not check this before either.)
+
+
+def _present_but_remove(path: Path, prompt: bool = True, exists: Optional[bool] = None) -> None:
+    if not _exists(path, exists):
+        raise FileNotFoundError(f"There must be '{path}' but there is not.")
     _remove(path, prompt)
 
 
-def _remove_comments(lines: list[str]) -> list[str]:
-    for line_no, line in enumerate(lines):
-        if "#" in line:
-            lines[line_no] = line[:line.index("#")]
-    return lines
+def _assert_present(path: Path, exists: Optional[bool], prompt: bool) -> None:
+    if not _exists(path, exists):
+        raise FileNotFoundError(f"You said there must be '{path}' but there is not.")
 
 
-def _remove_empty_lines(lines: list[str]) -> list[str]:
-    while lines[0].strip() == "":
-        lines = lines[1:]
-    while lines[-1].strip() == "":
-        lines = lines[:-1]
-    return lines
+def _assert_absent(path: Path, exists: Optional[bool], prompt: bool) -> None:
+    if _exists(path, exists):
+        raise FileExistsError(f"You said there must not be '{path}' but there is.")
 
 
-def _remove_trailing_slash_if_exists(s: str) -> str:
-    if s.endswith("/"):
-        s = s[:-1]
-    return s
+def _present_but_recreate(path: Path, exists: Optional[bool], prompt: bool) -> None:
+    _present_but_remove(path, prompt, exists)
+    _absent_but_create(path)
 
 
-def _remove_enclosing_quotation_marks(s: str) -> str:
-    if s.startswith("'") or s.startswith('"'):
-        s = s[1:]
-    if s.endswith("'") or s.endswith('"'):
-        s = s[:-1]
-    return s
+def _create(path: Path, exists: Optional[bool], prompt: bool) -> None:
+    if _exists(path, exists):
+        _present_but_remove(path, prompt, exists=True)
+    _absent_but_create(path)
+
+
+def _assert_that_is_all(path: Path, everything_else: set[str], prompt: bool) -> None:
+    if len(everything_else) > 0:
+        raise FileExistsError(f"'{path}' must not contain these: {everything_else}")
+
+
+def _remove_everything_else(path: Path, everything_else: set[str], prompt: bool) -> None:
+    for filename in everything_else:
+        _remove(path / filename, prompt)
 
 
 class FileCommand(Enum):
@@ -100,41 +143,40 @@ class FileCommand(Enum):
 
     @staticmethod
     def from_str(s: str) -> FileCommand:
-        command_dict = {command.value: command for command in FileCommand}
-        return command_dict[s]
+        return _FILE_COMMAND_MAP[s]
 
     @staticmethod
     def run(file_command: FileCommand, path: Path, prompt: bool = True) -> None:
-        if file_command == FileCommand.PRESENT:
-            assert path.exists(), f"You said there must be '{path}' but there is not."
+        FileCommand._run(file_command, path, None, prompt)
 
-        elif file_command == FileCommand.ABSENT:
-            assert not path.exists(), f"You said there must not be '{path}' but there is."
-
-        elif file_command == FileCommand.PRESENT_BUT_REMOVE:
-            _present_but_remove(path, prompt)
-
-        elif file_command == FileCommand.PRESENT_BUT_RECREATE:
-            _present_but_remove(path, prompt)
-            _absent_but_create(path)
+    @staticmethod
+    def _run_with_cache(file_command: FileCommand, path: Path, existing_entries: dict[str, os.DirEntry], prompt: bool = True) -> None:
+        # existing_entries: What the parent directory of path contains (i.e. listed beforehand).
+        # Being listed is not the same as path.exists(), so only a hit that is not a symlink (which may be broken) is trusted.
+        # Otherwise (e.g. "A.txt" while "a.txt" is listed on a case-insensitive file system), it is checked as usual.
+        entry = existing_entries.get(path.name)
+        exists = True if entry is not None and not entry.is_symlink() else None
+        FileCommand._run(file_command, path, exists, prompt)
 
-        elif file_command == FileCommand.ABSENT_BUT_CREATE:
-            _absent_but_create(path)
+    @staticmethod
+    def _run(file_command: FileCommand, path: Path, exists: Optional[bool], prompt: bool) -> None:
+        _FILE_COMMAND_HANDLERS[file_command](path, exists, prompt)
 
-        elif file_command == FileCommand.CREATE:
-            if path.exists():
-                _present_but_remove(path, prompt)
-            _absent_but_create(path)
+    def __str__(self):
+        return self.value
 
-        elif file_command == FileCommand.CREATE_IF_ABSENT:
-            if not path.exists():
-                _absent_but_create(path)
 
-        else:
-            assert False
+_FILE_COMMAND_MAP = FileCommand._value2member_map_  # value -> FileCommand
 
-    def __str__(self):
-        return self.value
+_FILE_COMMAND_HANDLERS = {  # FileCommand -> function(path, exists, prompt)
+    FileCommand.PRESENT: _assert_present,
+    FileCommand.ABSENT: _assert_absent,
+    FileCommand.PRESENT_BUT_REMOVE: lambda path, exists, prompt: _present_but_remove(path, prompt, exists),
+    FileCommand.PRESENT_BUT_RECREATE: _present_but_recreate,
+    FileCommand.ABSENT_BUT_CREATE: lambda path, exists, prompt: _absent_but_create(path, exists),
+    FileCommand.CREATE: _create,
+    FileCommand.CREATE_IF_ABSENT: lambda path, exists, prompt: _create_if_absent(path, exists),
+}
 
 
 class FileStructureCommand(Enum):
@@ -143,209 +185,213 @@ class FileStructureCommand(Enum):
 
     @staticmethod
     def from_str(s: str) -> FileStructureCommand:
-        command_dict = {command.value: command for command in FileStructureCommand}
-        return command_dict[s]
+        return _FILE_STRUCTURE_COMMAND_MAP[s]
 
     @staticmethod
     def run(file_structure_command: FileStructureCommand, path: Path, paths: list[Path], prompt: bool = True) -> None:
-        if not os.path.exists(path):
-            return
+        FileStructureCommand._run(file_structure_command, path, {current_path.name for current_path in paths if current_path.parent == path}, prompt)
 
-        all_files = {path / filename for filename in os.listdir(path)}
-        everything_else = all_files.difference(paths)
+    @staticmethod
+    def _run(file_structure_command: FileStructureCommand, path: Path, names: set[str], prompt: bool) -> None:
+        # Only names are compared. Paths are created only for the ones to be removed.
+        everything_else = _list_dir_entries(path).keys() - names  # Nothing if path does not exist.
+        _FILE_STRUCTURE_COMMAND_HANDLERS[file_structure_command](path, everything_else, prompt)
 
-        if file_structure_command == FileStructureCommand.THAT_IS_ALL:
-            assert len(everything_else) == 0, f"'{path}' must not contain these: {everything_else}"
+    def __str__(self):
+        return self.value
 
-        elif file_structure_command == FileStructureCommand.REMOVE_EVERYTHING_ELSE:
-            for current_path in everything_else:
-                _remove(current_path, prompt)
 
-        else:
-            assert False
+_FILE_STRUCTURE_COMMAND_MAP = FileStructureCommand._value2member_map_  # value -> FileStructureCommand
 
-    def __str__(self):
-        return self.value
+_FILE_STRUCTURE_COMMAND_HANDLERS = {  # FileStructureCommand -> function(path, everything_else, prompt)
+    FileStructureCommand.THAT_IS_ALL: _assert_that_is_all,
+    FileStructureCommand.REMOVE_EVERYTHING_ELSE: _remove_everything_else,
+}
 
 
 class FileStructure:
 
     @staticmethod
     def _parse_normal_line(line: str) -> tuple[str, Optional[FileCommand]]:
-        if line.endswith(">"):
-            last_space_index = line.rindex(" ")
-            filename = line[:last_space_index].strip()
-            command_str = line[last_space_index + 1:].strip()
-            file_command = FileCommand.from_str(command_str)
+        # Only the last word is matched (rather than the whole line), so that a long line does not cause backtracking.
+        words = line.rsplit(maxsplit=1)  # e.g. ["a.txt", "<0>"]
+        if len(words) == 2 and _COMMAND_RE.fullmatch(words[1]):
+            filename, command_str = words
         else:
-            filename = line
-            file_command = None
+            filename, command_str = line.rstrip(), None
+        if command_str is None and filename.endswith(">"):
+            raise ValueError(f"Invalid command (there must be whitespace before it): {line}")  # e.g. "a.txt<0>"
+        file_command = FileCommand.from_str(command_str) if command_str else None
 
-        filename = _remove_trailing_slash_if_exists(filename)
+        filename = filename.rstrip("/")  # Removing the trailing slash (if exists)
 
         return filename, file_command
 
     @staticmethod
     def _parse_file_structure_command_line(line: str) -> FileStructureCommand:
-        assert line.startswith("<<"), f"A {FileStructureCommand.__name__} must always be provided alone (i.e. not with a file)."
+        if not line.startswith("<<"):
+            raise ValueError(f"A {FileStructureCommand.__name__} must always be provided alone (i.e. not with a file): {line}")
         file_structure_command = FileStructureCommand.from_str(line)
         return file_structure_command
 
-    def _process_lines(self, lines: list[str]) -> None:
-
-        def calc_indent_length() -> int:
-            first_line, second_line = lines[:2]
-            first_line_num_spaces = len(first_line) - len(first_line.lstrip())
-            second_line_num_spaces = len(second_line) - len(second_line.lstrip())
-            indent_length = second_line_num_spaces - first_line_num_spaces  # There should be this many spaces for each indent.
-            assert indent_length > 0, f"Second line must be indented relative to first line.\nFirst line: {first_line}\nSecond line: {second_line}"
-            return indent_length
-
-        def calc_num_leading_spaces() -> int:
-            first_line = lines[0]
-            num_leading_spaces = len(first_line) - len(first_line.lstrip())
-            return num_leading_spaces
-
-        def calc_num_indents(line: str, indent_length: int, prev_is_ordinary_file: bool) -> int:
-            num_spaces = len(line) - len(line.lstrip()) - num_leading_spaces
-            assert num_spaces > 0, "All lines must be indented."
-            assert num_spaces % indent_length == 0, f"Indentations must be consistent: {line}"  # e.g. always 4*k spaces where k is an integer.
-            num_indents = num_spaces // indent_length
-
-            if prev_is_ordinary_file:
-                assert num_indents <= prev_num_indents, f"This line has too many indents: {line}"
-            else:
-                assert num_indents <= prev_num_indents + 1, f"This line has too many indents: {line}"
-            assert num_indents != 0, "There must be only one main directory."
-            return num_indents
+    @staticmethod
+    @functools.lru_cache(maxsize=128)
+    def _tokenize_and_validate(structure: str) -> tuple[tuple[int, tuple[str, ...], bool, Optional[Union[FileCommand, FileStructureCommand]]], ...]:
+        # Each line becomes a token: (num_indents, filenames, is_dir, command)
+        # The first token is the main directory (i.e. num_indents is 0).
+        # A line with a list has many filenames. A line with a FileStructureCommand has none.
+        # Comments, empty lines and indentation are all handled in this single pass over the lines.
+        # Parsing does not depend on anything but the string, so the same string is parsed only once.
+        # That is why everything is immutable (i.e. tuples), as the tokens are shared.
+
+        tokens = []
+
+        # Commonly, there are neither commands nor lists (i.e. just filenames). Then each line is simply a filename.
+        # (A "<" etc. in a comment only means that we do not take the shortcut.)
+        is_simple = "<" not in structure and ">" not in structure and "[" not in structure and "{" not in structure
+
+        num_leading_spaces = 0
+        indent_length = None  # There should be this many spaces for each indent.
+        prev_num_indents = 0
+        prev_is_ordinary_file = False
 
-        def process_line(lines: list[str], line_no: int, num_indents: int, num_leading_spaces: int, indent_length: int) -> tuple[int, bool]:
+        for line in structure.splitlines():
+            line = line.partition("#")[0]  # Removing the comment (if exists)
+            stripped_line = line.lstrip()
+            num_spaces = len(line) - len(stripped_line)
+            stripped_line = stripped_line.rstrip()
+            if stripped_line == "":
+                continue
+
+            if len(tokens) == 0:
+                first_line = line
+                num_leading_spaces = num_spaces
+                if stripped_line.endswith(">>"):
+                    raise ValueError(f"First line must not be a {FileStructureCommand.__name__}.")
+                main_dir_path, main_dir_file_command = FileStructure._parse_normal_line(stripped_line)
+                if not _is_seemingly_dir(main_dir_path):
+                    raise ValueError(f"The first line must be a directory: {line}")
+                tokens.append((0, (main_dir_path,), True, main_dir_file_command))
+                continue
+
+            num_spaces -= num_leading_spaces
+            if indent_length is None:
+                indent_length = num_spaces
+                if indent_length <= 0:
+                    raise ValueError(f"Second line must be indented relative to first line.\nFirst line: {first_line}\nSecond line: {line}")
+            if num_spaces <= 0:
+                raise ValueError(f"All lines must be indented: {line}")
+            if num_spaces % indent_length != 0:  # e.g. always 4*k spaces where k is an integer.
+                raise ValueError(f"Indentations must be consistent: {line}")
+            num_indents = num_spaces // indent_length
 
-            def process_line_block(lines: list[str], line_no: int, num_indents: int, num_leading_spaces: int, indent_length: int):
-                current_line_block = []
-                line_no += 1
-                while line_no < len(lines):
-                    current_line = lines[line_no]
-                    current_num_spaces = len(current_line) - len(current_line.lstrip()) - num_leading_spaces
-                    this_num_indents = current_num_spaces // indent_length
-                    if this_num_indents <= num_indents:
-                        break
-                    current_line_block.append(current_line)
-                    line_no += 1
+            max_num_indents = prev_num_indents if prev_is_ordinary_file else prev_num_indents + 1
+            if num_indents > max_num_indents:
+                raise ValueError(f"This line has too many indents: {line}")
 
-                return current_line_block, line_no
+            line = stripped_line
 
-            line = lines[line_no].strip()
+            if is_simple:
+                filename = line.rstrip("/")  # Removing the trailing slash (if exists)
+                is_dir = _is_seemingly_dir(filename)
+                tokens.append((num_indents, (filename,), is_dir, None))
+                is_ordinary_file = not is_dir
 
-            if line.endswith(">>"):
+            elif line.endswith(">>"):
                 file_structure_command = FileStructure._parse_file_structure_command_line(line)
-                assert self.main_dir_file_structure_command is None, f"At most 1 {FileStructureCommand.__name__} can be provided for a directory."
-                self.main_dir_file_structure_command = file_structure_command
-                line_no += 1
+                tokens.append((num_indents, (), False, file_structure_command))
                 is_ordinary_file = True  # Beyond it: This must be the last line.
 
             elif ("[" in line and "]" in line) or ("{" in line and "}" in line):
-                line = line.replace("{", "[").replace("}", "]")
                 filenames_str, file_command = FileStructure._parse_normal_line(line)
-                assert filenames_str[0] == "[" and filenames_str[-1] == "]"
-                filenames = [_remove_trailing_slash_if_exists(_remove_enclosing_quotation_marks(filename.strip()).strip()) for filename in filenames_str[1:-1].split(",")]
-
-                new_paths = [self.main_dir / filename for filename in filenames]
-
-                assert all([_is_seemingly_dir(filename) for filename in filenames]) or all([not _is_seemingly_dir(filename) for filename in filenames])
-                if _is_seemingly_dir(filenames[0]):
-                    # All are directories
-                    current_line_block, line_no = process_line_block(lines, line_no, num_indents, num_leading_spaces, indent_length)
-                    new_paths_or_file_structures = []
-                    for new_path in new_paths:
-                        this_line_block = [" " * (num_leading_spaces + indent_length) + str(new_path) + ("" if file_command is None else " " + file_command.value)] + current_line_block
-                        new_path_or_file_structure = FileStructure("\n".join(this_line_block), lazy_commands=True, prompt=self.prompt)  # Recursion
-                        new_paths_or_file_structures.append(new_path_or_file_structure)
-
-                    file_command = None  # We delegate the command (if exists) to the inner FileStructure.
-                    is_ordinary_file = False
-
-                else:
-                    # All are ordinary files
-                    new_paths_or_file_structures = new_paths
-                    is_ordinary_file = True
-                    line_no += 1
-
-                self.list_dir.extend(new_paths_or_file_structures)
-                self.list_dir_file_commands.extend([file_command] * len(filenames))
-                for filename, new_path_or_file_structure in zip(filenames, new_paths_or_file_structures):
-                    self.dict_dir[filename] = new_path_or_file_structure
+                if filenames_str[0] not in "[{" or filenames_str[-1] not in "]}":
+                    raise ValueError(f"A list must be provided alone (i.e. not with a file): {line}")
+                filenames = tuple(_remove_enclosing_quotation_marks(filename.strip()).rstrip("/") for filename in filenames_str[1:-1].split(","))
+                if "" in filenames:
+                    raise ValueError(f"A list must not be empty or contain an empty filename: {line}")
+                is_dir = _is_seemingly_dir(filenames[0])
+                if not all([_is_seemingly_dir(filename) == is_dir for filename in filenames[1:]]):
+                    raise ValueError(f"Either all or none of the filenames in a list must be directories: {line}")
+                tokens.append((num_indents, filenames, is_dir, file_command))
+                is_ordinary_file = not is_dir
 
             else:
                 filename, file_command = FileStructure._parse_normal_line(line)
-                new_path = self.main_dir / filename
-
-                if _is_seemingly_dir(new_path):
-
-                    current_line_block, line_no = process_line_block(lines, line_no, num_indents, num_leading_spaces, indent_length)
+                is_dir = _is_seemingly_dir(filename)
+                tokens.append((num_indents, (filename,), is_dir, file_command))
+                is_ordinary_file = not is_dir
 
-                    current_line_block = [" " * (num_leading_spaces + indent_length) + str(new_path) + ("" if file_command is None else " " + file_command.value)] + current_line_block
-                    new_path_or_file_structure = FileStructure("\n".join(current_line_block), lazy_commands=True, prompt=self.prompt)  # Recursion
-                    file_command = None  # We delegate the command (if exists) to the inner FileStructure.
-
-                    is_ordinary_file = False
-
-                else:
-                    line_no += 1
-                    new_path_or_file_structure = new_path
-                    is_ordinary_file = True
+            prev_num_indents = num_indents
+            prev_is_ordinary_file = is_ordinary_file
+
+        if len(tokens) == 0:
+            raise ValueError("There must be a main directory.")
+        return tuple(tokens)
+
+    def _process_tokens(self, tokens: tuple[tuple[int, tuple[str, ...], bool, Optional[Union[FileCommand, FileStructureCommand]]], ...]) -> None:
+        # stack[i] contains the directories (at depth i) that the lines at depth i + 1 belong to.
+        # There may be more than one since the directories in a list share the same content.
+        stack = [[self]]
+
+        for num_indents, filenames, is_dir, command in tokens[1:]:
+            del stack[num_indents:]  # Going back to the parent directory (if any)
+            parents = stack[-1]
+
+            if isinstance(command, FileStructureCommand):
+                for parent in parents:
+                    if parent.main_dir_file_structure_command is not None:
+                        raise ValueError(f"At most 1 {FileStructureCommand.__name__} can be provided for a directory: {parent.path()}")
+                    parent.main_dir_file_structure_command = command
+
+            elif is_dir:
+                new_file_structures = []
+                for parent in parents:
+                    for filename in filenames:
+                        # We delegate the command (if exists) to the inner FileStructure.
+                        new_file_structure = FileStructure._new_empty(parent.main_dir / filename, command, parent.prompt)
+                        parent._children.append((filename, None, new_file_structure))
+                        parent.dict_dir[filename] = new_file_structure
+                        new_file_structures.append(new_file_structure)
+                stack.append(new_file_structures)  # The following lines (if more indented) belong to these.
 
-                self.list_dir.append(new_path_or_file_structure)
-                self.list_dir_file_commands.append(file_command)
-                self.dict_dir[filename] = new_path_or_file_structure
+            else:
+                # Only the filename is kept. The Path is created when (if ever) it is needed.
+                for parent in parents:
+                    for filename in filenames:
+                        parent._children.append((filename, command, None))
+                        parent.dict_dir[filename] = filename
 
-            return line_no, is_ordinary_file
+    def _set_up(self, main_dir: Path, main_dir_file_command: Optional[FileCommand], prompt: bool) -> None:
+        self.prompt = prompt  # prompt for removing non-empty directories
 
-        indent_length = calc_indent_length()
-        num_leading_spaces = calc_num_leading_spaces()
+        self.main_dir = main_dir
+        self.main_dir_file_command = main_dir_file_command
+        self.main_dir_file_structure_command = None
 
-        prev_num_indents = 0
-        prev_is_ordinary_file = False
+        # (filename, file command, None) for ordinary files and (filename, None, FileStructure) for directories
+        # In the given order (i.e. not split by type), since do() must run the commands in that order.
+        self._children = []
 
-        line_no = 1
-        while line_no < len(lines):
-            line = lines[line_no]
-            num_indents = calc_num_indents(line, indent_length, prev_is_ordinary_file)
+        self.dict_dir = {}  # filename -> filename (for ordinary files) or FileStructure (for directories)
+        self._flat = {}  # Normalized key (e.g. "abc/def") -> Path, filled in by __getitem__ (i.e. only for what is indexed)
 
-            if num_indents == 1:
-                line_no, prev_is_ordinary_file = process_line(lines, line_no, num_indents, num_leading_spaces, indent_length)
-            else:
-                assert False, "..."
+        self.commands_run = False
 
-            prev_num_indents = num_indents
+    @classmethod
+    def _new_empty(cls, main_dir: Path, main_dir_file_command: Optional[FileCommand], prompt: bool) -> FileStructure:
+        # A FileStructure without any content yet (i.e. lazy commands). There is no string to parse.
+        file_structure = cls.__new__(cls)
+        file_structure._set_up(main_dir, main_dir_file_command, prompt)
+        return file_structure
 
     def __init__(self, structure: str, lazy_commands=False, prompt=True):
         # TODO: There may be "\t" rather than " ".
 
-        self.prompt = prompt  # prompt for removing non-empty directories
-        lines = structure.splitlines()
-
-        lines = _remove_comments(lines)
-        lines = _remove_empty_lines(lines)
-
-        first_line = lines[0].strip()
-        assert not first_line.endswith(">>"), f"First line must not be a {FileStructureCommand.__name__}."
-        main_dir_path, main_dir_file_command = FileStructure._parse_normal_line(first_line)
-        assert _is_seemingly_dir(main_dir_path), "The first line must be a directory."
-
-        self.main_dir = Path(main_dir_path)
-        self.main_dir_file_command = main_dir_file_command
-        self.main_dir_file_structure_command = None
-
-        self.list_dir = []
-        self.list_dir_file_commands = []
+        tokens = FileStructure._tokenize_and_validate(structure)
+        _, (main_dir_path,), _, main_dir_file_command = tokens[0]
+        self._set_up(Path(main_dir_path), main_dir_file_command, prompt)
+        self._process_tokens(tokens)
 
-        self.dict_dir = {}
-
-        if len(lines) > 1:
-            self._process_lines(lines)
-
-        self.commands_run = False
         if not lazy_commands:
             self.do()
 
@@ -353,29 +399,39 @@ class FileStructure:
         return self.main_dir
 
     def children(self) -> list[Union[Path, FileStructure]]:
-        return self.list_dir
+        # In the given order
+        return [self.main_dir / filename if file_structure is None else file_structure for filename, _, file_structure in self._children]
 
     def do(self) -> None:
         if not self.commands_run:
 
             if self.main_dir_file_structure_command is not None:
-                paths = [child if isinstance(child, Path) else child.path() for child in self.children()]
-                FileStructureCommand.run(self.main_dir_file_structure_command, self.path(), paths, prompt=self.prompt)
+                names = {filename for filename, _, _ in self._children}  # e.g. "sub/a.txt" is not a name in self.path()
+                FileStructureCommand._run(self.main_dir_file_structure_command, self.path(), names, self.prompt)
 
             if self.main_dir_file_command is not None:
                 FileCommand.run(self.main_dir_file_command, self.path(), prompt=self.prompt)
 
-            for child, file_command in zip(self.list_dir, self.list_dir_file_commands):
-                if isinstance(child, Path):
-                    if file_command is not None:
-                        FileCommand.run(file_command, child, prompt=self.prompt)
-
-                elif isinstance(child, FileStructure):
-                    assert file_command is None, "Bug :("  # We have delegated the command.
-                    child.do()
-
-                else:
-                    assert False, "Bug :("
+            # The main directory is listed (once) only after its own command, which may change its content.
+            existing_entries = None
+            run_names = set()  # A path given more than once (e.g. in a list and alone) may have changed since the listing.
+
+            # In the given order, since a command may depend on an earlier one (e.g. "sub <4>" and then "sub/a.txt <4>").
+            for filename, file_command, file_structure in self._children:
+                if file_structure is not None:
+                    file_structure.do()  # We have delegated the command (if exists) to it.
+                elif file_command is not None:
+                    child_path = self.main_dir / filename
+                    if filename in run_names or "/" in filename:
+                        FileCommand.run(file_command, child_path, prompt=self.prompt)
+                    else:
+                        if existing_entries is None:
+                            try:
+                                existing_entries = _list_dir_entries(self.path())
+                            except NotADirectoryError:
+                                existing_entries = {}  # Nothing is trusted, so each command checks its own path.
+                        FileCommand._run_with_cache(file_command, child_path, existing_entries, prompt=self.prompt)
+                        run_names.add(filename)
 
             self.commands_run = True
 
@@ -423,27 +479,35 @@ class FileStructure:
         # But they must be defined when constructing the FileStructure object.
         # This is a design decision.
         # A FileStructure object contains all the files that already exist and that will be existing at some point in the future.
-        assert isinstance(key, str)
-
-        if key == "" or key == "/":
-            return self.path()
+        if not isinstance(key, str):
+            raise TypeError(f"Key must be a str, not {type(key).__name__}.")
 
-        # Remove leading and trailing slash(es).
-        while key[0] == "/":
-            key = key[1:]
-        while key[-1] == "/":
-            key = key[:-1]
+        key = key.strip("/")  # Remove leading and trailing slash(es).
         # Note: file_structure[a][b] and file_structure[a+"/"+b] are the same thing if b != ""
 
-        if "/" in key:
-            filenames = key.split("/")
-            path_or_file_structure = self  # This is FileStructure now.
-            for filename in filenames:
-                path_or_file_structure = path_or_file_structure[filename]
-            return _as_path(path_or_file_structure)
+        if key == "":  # e.g. "" or "/"
+            return self.path()
+
+        if key in self._flat:
+            return self._flat[key]
+
+        # One directory at a time (only the first time)
+        *dirnames, filename = key.split("/")
+        file_structure = self
+        for dirname in dirnames:
+            if dirname == "":  # e.g. "abc//def"
+                continue
+            file_structure = file_structure.dict_dir[dirname]
+            if not isinstance(file_structure, FileStructure):
+                raise KeyError(key)  # An ordinary file does not contain anything.
+
+        filename_or_file_structure = file_structure.dict_dir[filename]
+        if isinstance(filename_or_file_structure, str):
+            path = file_structure.main_dir / filename_or_file_structure
         else:
-            path_or_file_structure = self.dict_dir[key]
-            return _as_path(path_or_file_structure)
+            path = filename_or_file_structure.path()
+        self._flat[key] = path
+        return path
 
     def __truediv__(self, other: str) -> Path:
         # file_structure / s  is the same as  file_structure[s]
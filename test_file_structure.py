@@ -0,0 +1,274 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from file_structure import FileStructure, FileCommand, FileStructureCommand
+
+
+"""
+Regression tests: The demo.py cases are run in a temporary directory and the resulting trees are compared with
+the ones the original (recursive) implementation produced.
+Run with: python -m unittest test_file_structure
+"""
+
+
+def _tree() -> list[str]:
+    # Relative paths under the current directory (directories end with "/")
+    paths = []
+    for dir_path, dirnames, filenames in os.walk("."):
+        paths += [os.path.normpath(os.path.join(dir_path, dirname)) + "/" for dirname in dirnames]
+        paths += [os.path.normpath(os.path.join(dir_path, filename)) for filename in filenames]
+    return sorted(paths)
+
+
+def _numbered(main_dir: str, subdirs: list[str]) -> list[str]:
+    # e.g. "abc3/1/", "abc3/1/a/", ..., "abc3/9/z/"
+    return [f"{main_dir}/{i}/{subdir}" for i in range(1, 10) for subdir in [""] + subdirs]
+
+
+class TestDemos(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+    def _create(self, paths: list[str]) -> None:
+        for path in paths:
+            if path.endswith("/"):
+                os.makedirs(path)
+            else:
+                with open(path, "w") as f:
+                    f.write("content")
+
+    def test_demo_0(self):
+        root_dir = os.path.join(os.getcwd(), "abc")
+        a_filename = "a.mp4"
+        abc = FileStructure(f"""
+        {root_dir}                  # This is a comment. You can add comments.
+            xyz
+                x.txt
+                y.png
+                z
+            {a_filename}            # e.g. a.mp4
+            b.mp4
+        """)
+        xyz = abc["xyz"]
+        self.assertEqual(xyz / "x.txt", Path(root_dir) / "xyz" / "x.txt")
+        self.assertEqual(xyz / "z", Path(root_dir) / "xyz" / "z")
+        self.assertEqual(abc / a_filename, Path(root_dir) / "a.mp4")
+        self.assertEqual(abc["xyz/z"], Path(root_dir) / "xyz" / "z")
+        self.assertEqual(abc.path(), Path(root_dir))
+        self.assertEqual(_tree(), [])  # No commands
+
+    def test_demo_1(self):
+        self._create(["abc/", "abc/a.mp4", "abc/extra.txt"])
+        FileStructure(f"""
+        abc {FileCommand.PRESENT}
+            xyz {FileCommand.CREATE_IF_ABSENT}
+                x.txt {FileCommand.ABSENT_BUT_CREATE}
+                y.png
+                z
+                {FileStructureCommand.THAT_IS_ALL}
+            a.mp4
+            b.mp4
+            {FileStructureCommand.REMOVE_EVERYTHING_ELSE}
+        """, prompt=False)
+        self.assertEqual(_tree(), ["abc/", "abc/a.mp4", "abc/xyz/", "abc/xyz/x.txt"])
+
+        self._create(["main_dir/", "main_dir/a.txt", "main_dir/c/", "main_dir/old.txt"])
+        FileStructure(f"""
+            main_dir {FileCommand.PRESENT}
+                a.txt {FileCommand.PRESENT_BUT_RECREATE}
+                b.png {FileCommand.ABSENT}
+                c {FileCommand.PRESENT}
+                    d {FileCommand.CREATE_IF_ABSENT}
+                    e {FileCommand.CREATE}
+                    f {FileCommand.CREATE_IF_ABSENT}
+                    {FileStructureCommand.THAT_IS_ALL}
+                g {FileCommand.CREATE}
+                {FileStructureCommand.REMOVE_EVERYTHING_ELSE}
+        """, prompt=False)
+        self.assertEqual([path for path in _tree() if path.startswith("main_dir")], [
+            "main_dir/", "main_dir/a.txt", "main_dir/c/", "main_dir/c/d/", "main_dir/c/e/", "main_dir/c/f/", "main_dir/g/"
+        ])
+        self.assertEqual(os.path.getsize("main_dir/a.txt"), 0)  # Recreated
+
+    def test_demo_2(self):
+        FileStructure(f"""
+        abc1 {FileCommand.CREATE}
+            {[1, 5, 10]} {FileCommand.CREATE}
+            a {FileCommand.CREATE}
+        """, prompt=False)
+        self.assertEqual(_tree(), ["abc1/", "abc1/1/", "abc1/10/", "abc1/5/", "abc1/a/"])
+
+        FileStructure(f"""
+        abc2 {FileCommand.CREATE_IF_ABSENT}
+            {[f"{letter}.txt" for letter in ("A", "B", "C")]} {FileCommand.CREATE_IF_ABSENT}
+            {[i for i in range(1, 10)]} {FileCommand.CREATE_IF_ABSENT}
+            a {FileCommand.CREATE_IF_ABSENT}
+                {[i for i in range(1, 10)]} {FileCommand.CREATE_IF_ABSENT}
+                {FileStructureCommand.REMOVE_EVERYTHING_ELSE}
+        """, prompt=False)
+        expected = ["abc2/", "abc2/A.txt", "abc2/B.txt", "abc2/C.txt", "abc2/a/"] + _numbered("abc2", []) + _numbered("abc2/a", [])
+        self.assertEqual([path for path in _tree() if path.startswith("abc2")], sorted(expected))
+
+        FileStructure(f"""
+        abc3 {FileCommand.CREATE_IF_ABSENT}
+            {[i for i in range(1, 10)]} {FileCommand.CREATE_IF_ABSENT}
+                a {FileCommand.CREATE_IF_ABSENT}
+                {["x", "y", "z"]} {FileCommand.CREATE_IF_ABSENT}
+        """, prompt=False)
+        expected = ["abc3/"] + _numbered("abc3", ["a/", "x/", "y/", "z/"])
+        self.assertEqual([path for path in _tree() if path.startswith("abc3")], sorted(expected))
+
+        FileStructure(f"""
+        abc4 {FileCommand.CREATE_IF_ABSENT}
+            {[i for i in range(1, 10)]} {FileCommand.CREATE_IF_ABSENT}
+                a {FileCommand.CREATE_IF_ABSENT}
+                {["x", "y", "z"]} {FileCommand.CREATE_IF_ABSENT}
+            1 {FileCommand.PRESENT}
+                extra_dir {FileCommand.CREATE}
+        """, prompt=False)
+        expected = ["abc4/", "abc4/1/extra_dir/"] + _numbered("abc4", ["a/", "x/", "y/", "z/"])
+        self.assertEqual([path for path in _tree() if path.startswith("abc4")], sorted(expected))
+
+
+class TestGetItem(unittest.TestCase):
+
+    def setUp(self):
+        self.abc = FileStructure("""
+        abc
+            xyz
+                x.txt
+                z
+            a.mp4
+        """, lazy_commands=True)
+
+    def test_keys(self):
+        abc = Path("abc")
+        self.assertEqual(self.abc["a.mp4"], abc / "a.mp4")
+        self.assertEqual(self.abc["xyz"], abc / "xyz")
+        self.assertEqual(self.abc["xyz/z"], abc / "xyz" / "z")
+        self.assertEqual(self.abc["/xyz/x.txt/"], abc / "xyz" / "x.txt")
+        self.assertEqual(self.abc / "xyz/z", abc / "xyz" / "z")
+
+    def test_keys_that_are_not_normalized(self):
+        self.assertEqual(self.abc["xyz//z"], Path("abc/xyz/z"))
+        self.assertEqual(self.abc[""], Path("abc"))
+        self.assertEqual(self.abc["/"], Path("abc"))
+        self.assertEqual(self.abc["//"], Path("abc"))
+
+    def test_lookups_are_remembered(self):
+        self.assertEqual(self.abc["xyz/z"], Path("abc/xyz/z"))
+        self.assertEqual(self.abc._flat, {"xyz/z": Path("abc/xyz/z")})
+        self.assertEqual(self.abc["xyz/z"], Path("abc/xyz/z"))
+
+    def test_missing_keys(self):
+        for key in ["nope", "xyz/nope", "a.mp4/x", "xyz/x.txt/y"]:
+            with self.assertRaises(KeyError):
+                self.abc[key]
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def test_tokens_are_reused(self):
+        structure = """
+        abc
+            xyz
+                x.txt
+            a.mp4
+        """
+        FileStructure(structure, lazy_commands=True)  # Tokenized (if not already)
+        hits = FileStructure._tokenize_and_validate.cache_info().hits
+        first = FileStructure(structure, lazy_commands=True, prompt=True)
+        second = FileStructure(structure, lazy_commands=True, prompt=False)
+        self.assertEqual(FileStructure._tokenize_and_validate.cache_info().hits, hits + 2)
+
+        # The tokens are shared, but the objects built from them are not.
+        self.assertIsNot(first.dict_dir["xyz"], second.dict_dir["xyz"])
+        self.assertTrue(first.prompt and first.dict_dir["xyz"].prompt)
+        self.assertFalse(second.prompt or second.dict_dir["xyz"].prompt)
+        self.assertEqual(first.children(), [first.dict_dir["xyz"], Path("abc/a.mp4")])
+        self.assertEqual(second.children(), [second.dict_dir["xyz"], Path("abc/a.mp4")])
+        first.dict_dir["xyz"].dict_dir["y.txt"] = "y.txt"
+        self.assertNotIn("y.txt", second.dict_dir["xyz"].dict_dir)
+
+
+class TestRegressions(unittest.TestCase):
+
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(temp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+    def test_commands_run_in_the_given_order(self):
+        FileStructure(f"""
+        d {FileCommand.CREATE}
+            sub {FileCommand.ABSENT_BUT_CREATE}
+            sub/a.txt {FileCommand.ABSENT_BUT_CREATE}
+        """, prompt=False)
+        self.assertEqual(_tree(), ["d/", "d/sub/", "d/sub/a.txt"])
+
+    def test_only_the_children_are_kept(self):
+        os.makedirs("d/sub/x2")
+        os.makedirs("d/x2")
+        FileStructure(f"""
+        d
+            sub
+            sub/x2
+            {FileStructureCommand.REMOVE_EVERYTHING_ELSE}
+        """, prompt=False)
+        self.assertEqual(_tree(), ["d/", "d/sub/", "d/sub/x2/"])
+
+        os.makedirs("e")
+        open(os.path.join("e", "a.txt"), "w").close()
+        FileStructureCommand.run(FileStructureCommand.REMOVE_EVERYTHING_ELSE, Path("e"), [Path("other/a.txt")], prompt=False)
+        self.assertEqual(_tree(), ["d/", "d/sub/", "d/sub/x2/", "e/"])
+
+    def test_quotes_inside_list_items(self):
+        FileStructure(f"""
+        d {FileCommand.CREATE}
+            {["it's", 'b']} {FileCommand.CREATE}
+            {["it's.txt", 'b.txt']} {FileCommand.CREATE}
+        """, prompt=False)
+        self.assertEqual(_tree(), ["d/", "d/b.txt", "d/b/", "d/it's.txt", "d/it's/"])
+
+    def test_malformed_lines(self):
+        for structure in ["d\n    []", "d\n    [a, ]", "d\n    a.txt<0>"]:
+            with self.assertRaises(ValueError):
+                FileStructure(structure, lazy_commands=True)
+
+    def test_long_lines(self):
+        # Parsed in linear time (i.e. no backtracking over the spaces)
+        name = "a" + " " * 20000 + "b"
+        self.assertEqual(FileStructure._parse_normal_line(f"{name}   {FileCommand.ABSENT}"), (name, FileCommand.ABSENT))
+        self.assertEqual(FileStructure._parse_normal_line(name + " " * 20000), (name, None))
+
+    def test_main_dir_that_is_an_ordinary_file(self):
+        open("d", "w").close()
+        for command in FileStructureCommand:
+            with self.assertRaises(NotADirectoryError):
+                FileStructure(f"d\n    a.txt\n    {command}", prompt=False)
+        FileStructure(f"d\n    a.txt {FileCommand.ABSENT}", prompt=False)
+        self.assertEqual(_tree(), ["d"])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "Symlinks are not supported.")
+    def test_broken_symlink_does_not_exist(self):
+        os.makedirs("d")
+        try:
+            os.symlink("nonexistent", os.path.join("d", "broken.txt"))
+        except OSError:
+            self.skipTest("Symlinks cannot be created.")
+        FileStructure(f"d\n    broken.txt {FileCommand.ABSENT}", prompt=False)
+        with self.assertRaises(FileNotFoundError):
+            FileStructure(f"d\n    broken.txt {FileCommand.PRESENT}", prompt=False)
+
+
+if __name__ == "__main__":
+    unittest.main()